@@ -45,6 +45,15 @@ def focal_loss(gamma=2.0, alpha=0.25):
     return loss_fn
 
 
+def enable_xla_autoclustering():
+    """
+    Turn on XLA auto-clustering for the process, so the losses, the metric updates and the
+    elementwise ops of the output heads can be fused across op boundaries
+    Has to run before the model is built; only training opts in, the inference server never calls it
+    """
+    tf.config.optimizer.set_jit('autoclustering')
+
+
 def compute_class_weights(dataset, samples=20):
     """
     Calculate class weights from dataset statistics
@@ -165,10 +174,13 @@ def create_callbacks(model_save_path, val_dataset):
     return callbacks
 
 
-def train_model(dataset_dir, model_save_path, batch_size=8, epochs=50):
+def train_model(dataset_dir, model_save_path, batch_size=8, epochs=50, xla_autoclustering=False):
     """
     Train the piano transcription model
     """
+    if xla_autoclustering:
+        enable_xla_autoclustering()
+
     os.makedirs(model_save_path, exist_ok=True)
     vis_path = os.path.join(model_save_path, 'plots')
     os.makedirs(vis_path, exist_ok=True)
@@ -353,10 +365,12 @@ if __name__ == "__main__":
     model_save_path = "piano_transcription_model"
     batch_size = 16
     epochs = 50
+    xla_autoclustering = os.environ.get("XLA_AUTOCLUSTERING", "").lower() in ("1", "true", "yes")
 
     model, history = train_model(
         dataset_dir=dataset_dir,
         model_save_path=model_save_path,
         batch_size=batch_size,
-        epochs=epochs
+        epochs=epochs,
+        xla_autoclustering=xla_autoclustering
     )
@@ -1,15 +1,21 @@
 #!/usr/bin/env python3
 import os
+import io
 import uuid
-import json
 import time
 import tempfile
 import threading
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 import atexit
+import functools
+import hashlib
+from collections import OrderedDict
 
 import numpy as np
+import orjson
 import tensorflow as tf
 import librosa
 from flask import Flask, request, jsonify, send_file, g
@@ -17,6 +23,8 @@ from flask_cors import CORS
 import mido
 from pydub import AudioSegment
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from werkzeug.utils import secure_filename
 import logging
 import gc
@@ -24,6 +32,7 @@ import subprocess
 import shutil
 from scipy import ndimage
 from scipy.signal import find_peaks
+import soundfile as sf
 
 from typing import List, Tuple, Dict, Any
 
@@ -32,7 +41,8 @@ from models.model_loader import ModelLoader
 from utils.utils import weighted_binary_crossentropy, focal_loss, F1Score
 from models.architecture import acoustic_feature_extractor, vertical_dependencies_layer, lstm_with_attention, \
     onset_subnetwork, frame_subnetwork, offset_subnetwork, velocity_subnetwork, build_model
-from postprocessing.postprocessing import MusicTranscriptionPostprocessor
+from postprocessing.postprocessing import MusicTranscriptionPostprocessor, MIDI_TO_NAME, MIDI_TO_HZ
+from preprocessing.preprocessing import load_audio, extract_mel_spectrogram, wav_to_mel
 
 # Configure logging for better debugging
 logging.basicConfig(
@@ -53,12 +63,34 @@ OUTPUT_FOLDER = '/app/output'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
+# Keep a copy of /process-audio uploads on disk (debugging only; they are decoded from memory)
+SAVE_UPLOADS = os.environ.get("SAVE_UPLOADS", "").lower() in ("1", "true", "yes")
+
+# RAM-backed scratch directory for small, short-lived temp files (falls back to the system default off Linux).
+# Docker gives containers a 64 MB /dev/shm by default, so whole recordings stay on disk
+TEMP_DIR = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else None
+
 # AWS S3 Configuration - EXACTLY as original
 AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
 AWS_BUCKET_NAME = "flutter-audio-uploads"
 AWS_ACCESS_KEY = os.environ.get("AWS_ACCESS_KEY")
 AWS_SECRET_KEY = os.environ.get("AWS_SECRET_KEY")
 
+# Shared client settings: a larger keep-alive connection pool for parallel metadata reads
+S3_CLIENT_CONFIG = Config(
+    max_pool_connections=64,
+    tcp_keepalive=True,
+    retries={'max_attempts': 3, 'mode': 'adaptive'},
+    s3={'addressing_style': 'virtual'}
+)
+
+# Multipart, multithreaded transfers for larger audio files
+S3_TRANSFER_CONFIG = TransferConfig(
+    use_threads=True,
+    max_concurrency=8,
+    multipart_threshold=8 * 1024 * 1024
+)
+
 s3_client = None
 if AWS_ACCESS_KEY and AWS_SECRET_KEY:
     try:
@@ -66,7 +98,8 @@ if AWS_ACCESS_KEY and AWS_SECRET_KEY:
             's3',
             aws_access_key_id=AWS_ACCESS_KEY,
             aws_secret_access_key=AWS_SECRET_KEY,
-            region_name=AWS_REGION
+            region_name=AWS_REGION,
+            config=S3_CLIENT_CONFIG
         )
         logger.info("✅ S3 client initialized")
     except Exception as e:
@@ -270,9 +303,109 @@ class StableModelLoader:
                 return False
 
 
+class BatchingQueue:
+    """Micro-batches concurrent model calls into a single forward pass"""
+
+    def __init__(self, model_provider, max_batch_size=8, max_wait=0.01):
+        self.model_provider = model_provider
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait  # seconds to wait for more requests before running
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.worker = None
+
+    def submit(self, spec):
+        """Queue a [1, time, 229, 1] spectrogram and return a Future of its predictions"""
+        future = Future()
+        self._ensure_worker()
+        self.requests.put((spec, future))
+        return future
+
+    def _ensure_worker(self):
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name="model-batcher", daemon=True)
+                self.worker.start()
+
+    def _collect_batch(self):
+        """Block for the first request, then gather more until the batch is full or the wait expires"""
+        items = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect_batch()
+
+            # Only spectrograms of the same shape can be stacked into one batch
+            groups = {}
+            for spec, future in items:
+                groups.setdefault(tuple(spec.shape), []).append((spec, future))
+
+            for group in groups.values():
+                self._predict_group(group)
+
+    def _predict_group(self, group):
+        try:
+            model = self.model_provider()
+            batch = tf.concat([spec for spec, _ in group], axis=0)
+            predictions = model.predict(batch)
+
+            if len(group) > 1:
+                logger.info(f"🧠 Batched {len(group)} transcription requests into one prediction")
+
+            for i, (_, future) in enumerate(group):
+                future.set_result([output[i:i + 1] for output in predictions])
+
+        except Exception as e:
+            logger.error(f"❌ Batched prediction failed: {e}")
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+
+
+class TranscriptionCache:
+    """LRU cache of /process-audio results keyed by the SHA-256 of the uploaded audio"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # digest -> (notes, midi_bytes)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, digest):
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is not None:
+                self.entries.move_to_end(digest)
+            return entry
+
+    def put(self, digest, notes, midi_bytes):
+        with self.lock:
+            self.entries[digest] = (notes, midi_bytes)
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
 # Initialize stable model loader
 stable_model_loader = StableModelLoader()
-logger.info("Model loader initialized - model will load on first recordings endpoint request")
+model_batcher = BatchingQueue(stable_model_loader.get_model)
+transcription_cache = TranscriptionCache()
+logger.info("Model loader initialized - model is loading and warming up in the background")
 
 
 # =============================================================================
@@ -320,6 +453,7 @@ def safe_file_processing(file, platform_type):
         raise
 
 
+@functools.lru_cache(maxsize=1)
 def check_musescore_with_display():
     """Check MuseScore with proper display setup - ORIGINAL"""
     try:
@@ -354,17 +488,19 @@ def check_musescore_with_display():
         return False, None, str(e)
 
 
+@functools.lru_cache(maxsize=1)
 def check_musescore_installation():
     """Updated function that works with your Dockerfile setup - ORIGINAL"""
     return check_musescore_with_display()[:2]
 
 
+# MuseScore cannot appear or disappear while the worker runs, so probe it once
+_MUSESCORE_STATUS = check_musescore_installation()
+
+
 def pitch_to_note_name(pitch):
     """Convert MIDI pitch number to note name - ORIGINAL"""
-    note_names = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-    octave = (pitch // 12) - 1
-    note = note_names[pitch % 12]
-    return f"{note}{octave}"
+    return MIDI_TO_NAME[pitch]
 
 
 def clean_up_notes(notes_list, min_duration=0.05, merge_gap=0.08, confidence_threshold=0.4):
@@ -400,7 +536,7 @@ def clean_up_notes(notes_list, min_duration=0.05, merge_gap=0.08, confidence_thr
     return merged_notes
 
 
-def extract_notes_from_predictions(predictions):
+def extract_notes_from_predictions(predictions, raise_on_error=False):
     """Enhanced note extraction using sophisticated postprocessing - ORIGINAL"""
     logger.info("🎼 Extracting notes with enhanced postprocessing...")
 
@@ -409,7 +545,8 @@ def extract_notes_from_predictions(predictions):
         frame_threshold=0.3,
         min_note_duration=0.05,
         max_note_duration=8.0,
-        time_resolution=0.032
+        time_resolution=0.032,
+        raise_on_error=raise_on_error
     )
 
     refined_notes = postprocessor.process_predictions(predictions)
@@ -460,53 +597,43 @@ def create_midi_from_notes(notes, output_path):
     tempo = 500000
     ticks_per_second = ticks_per_beat / (tempo / 1000000)
 
-    notes = sorted(notes, key=lambda x: x['time'])
-    events = []
-
+    valid_notes = []
     for note in notes:
         if note['time'] < 0 or note['duration'] <= 0:
             logger.debug(f"Skipping invalid note: time={note['time']}, duration={note['duration']}")
             continue
-
-        onset_time_ticks = int(max(0, note['time'] * ticks_per_second))
-        offset_time_ticks = onset_time_ticks + int(max(1, note['duration'] * ticks_per_second))
-
-        velocity_raw = note['velocity_midi']
-        if velocity_raw > 5:
-            velocity_raw = 100
-
-        velocity = max(0, min(127, velocity_raw))
-
-        events.append((onset_time_ticks, 'note_on', note['pitch'], velocity))
-        events.append((offset_time_ticks, 'note_off', note['pitch'], 0))
-
-    events.sort()
-
-    last_time = 0
-    for abs_time, msg_type, pitch, velocity in events:
-        delta_time = max(0, abs_time - last_time)
-
-        if msg_type == 'note_on':
-            track.append(mido.Message('note_on', note=pitch, velocity=velocity, time=delta_time))
-        else:
-            track.append(mido.Message('note_off', note=pitch, velocity=velocity, time=delta_time))
-
-        last_time = abs_time
+        valid_notes.append(note)
+
+    if valid_notes:
+        times = np.array([note['time'] for note in valid_notes], dtype=np.float64)
+        durations = np.array([note['duration'] for note in valid_notes], dtype=np.float64)
+        pitches = np.array([note['pitch'] for note in valid_notes], dtype=np.int64)
+        velocities_raw = np.array([note['velocity_midi'] for note in valid_notes], dtype=np.int64)
+
+        onset_ticks = np.maximum(0, times * ticks_per_second).astype(np.int64)
+        offset_ticks = onset_ticks + np.maximum(1, durations * ticks_per_second).astype(np.int64)
+        velocities = np.clip(np.where(velocities_raw > 5, 100, velocities_raw), 0, 127)
+
+        # One note_on and one note_off event per note
+        abs_times = np.concatenate([onset_ticks, offset_ticks])
+        is_note_on = np.concatenate([np.ones_like(pitches), np.zeros_like(pitches)])
+        event_pitches = np.concatenate([pitches, pitches])
+        event_velocities = np.concatenate([velocities, np.zeros_like(velocities)])
+
+        # Same ordering as sorting (time, type, pitch, velocity) tuples: note_off before note_on
+        order = np.lexsort((event_velocities, event_pitches, is_note_on, abs_times))
+        delta_times = np.diff(abs_times[order], prepend=0)
+
+        for delta_time, note_on, pitch, velocity in zip(delta_times.tolist(), is_note_on[order].tolist(),
+                                                        event_pitches[order].tolist(),
+                                                        event_velocities[order].tolist()):
+            msg_type = 'note_on' if note_on else 'note_off'
+            track.append(mido.Message(msg_type, note=pitch, velocity=velocity, time=delta_time))
 
     mid.save(output_path)
     return output_path
 
 
-def extract_mel_spectrogram(audio_path, sr=16000, n_mels=229, hop_length=512, n_fft=2048):
-    """Extract mel spectrogram - ORIGINAL"""
-    y, _ = librosa.load(audio_path, sr=sr)
-    mel_spec = librosa.feature.melspectrogram(
-        y=y, sr=sr, n_mels=n_mels, hop_length=hop_length, n_fft=n_fft
-    )
-    log_mel_spec = librosa.power_to_db(mel_spec, ref=np.max)
-    return log_mel_spec
-
-
 def convert_audio_to_wav(input_path, output_path, sample_rate=16000):
     """Simple function to convert audio files to WAV format - ORIGINAL"""
     try:
@@ -525,22 +652,48 @@ def convert_audio_to_wav(input_path, output_path, sample_rate=16000):
         return False
 
 
-def convert_m4a_to_wav(input_path, output_path, sample_rate=16000):
-    """Convert specifically M4A to WAV format - ORIGINAL"""
+def write_temp_file(data, suffix=''):
+    """Write bytes to a new temp file in TEMP_DIR, or on disk if /dev/shm is full; the caller removes it"""
+    for directory in dict.fromkeys([TEMP_DIR, None]):
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=directory) as tmp:
+                tmp_path = tmp.name
+                tmp.write(data)
+            return tmp_path
+        except OSError as e:
+            clean_up_local_file(tmp_path)
+            if directory is None:
+                raise
+            logger.warning(f"⚠️ Could not write a temp file to {directory} ({e}), using disk instead")
+
+
+def decode_audio_with_ffmpeg(audio_bytes, sample_rate=16000):
+    """Decode any ffmpeg-readable audio bytes straight to mono float32 samples, without temp files"""
+    cmd = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-i', 'pipe:0',
+           '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', str(sample_rate), 'pipe:1']
     try:
-        audio = AudioSegment.from_file(input_path, format="m4a")
-        audio = audio.set_frame_rate(sample_rate)
+        result = subprocess.run(cmd, input=audio_bytes, capture_output=True, timeout=60)
 
-        if audio.channels > 1:
-            audio = audio.set_channels(1)
+        if result.returncode != 0:
+            # MP4/M4A files with the index at the end cannot be demuxed from a pipe; decode from a file instead
+            logger.info("ffmpeg could not decode from a pipe, retrying from a temp file")
+            tmp_path = write_temp_file(audio_bytes)
+            try:
+                cmd[cmd.index('pipe:0')] = tmp_path
+                result = subprocess.run(cmd, capture_output=True, timeout=60)
+            finally:
+                clean_up_local_file(tmp_path)
 
-        audio.export(output_path, format="wav")
-        logger.info(f"Converted {input_path} to {output_path}")
-        return True
+        if result.returncode != 0:
+            logger.error(f"ffmpeg decode failed: {result.stderr.decode(errors='replace')}")
+            return None
+
+        return np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
 
     except Exception as e:
-        logger.error(f"Error converting audio: {e}")
-        return False
+        logger.error(f"Error decoding audio: {e}")
+        return None
 
 
 def convert_midi_to_musicxml(midi_path, output_path):
@@ -581,28 +734,39 @@ def convert_musicxml_to_pdf(musicxml_path, pdf_path):
         return False, f"PDF conversion error: {str(e)}"
 
 
+def convert_midi_to_pdf(midi_path, musicxml_path, pdf_path):
+    """Render the PDF straight from the MIDI with a single MuseScore start, two-step conversion via MusicXML as fallback"""
+    # MuseScore picks the importer from the input's extension, so the same export renders a MIDI file
+    success, message = convert_musicxml_to_pdf(midi_path, pdf_path)
+    if success:
+        return True, message
+
+    logger.warning(f"⚠️ {message} - falling back to two-step conversion")
+    success, message = convert_midi_to_musicxml(midi_path, musicxml_path)
+    if not success:
+        return False, message
+    return convert_musicxml_to_pdf(musicxml_path, pdf_path)
+
+
 def process_spectrogram_for_model(mel_spec):
     """Process the spectrogram to fit model input requirements - ORIGINAL"""
     expected_height = 229
-    expected_width = 626
 
+    # extract_mel_spectrogram always produces n_mels=229 bins
     if mel_spec.shape[0] != expected_height:
-        mel_spec = tf.image.resize(
-            tf.expand_dims(mel_spec, 0),
-            [expected_height, mel_spec.shape[1]]
-        )[0]
+        raise ValueError(f"Unexpected mel height {mel_spec.shape[0]}, expected {expected_height}")
+
+    return shape_to_input(mel_spec.astype(np.float32, copy=False))
 
-    if mel_spec.shape[1] < expected_width:
-        padding = expected_width - mel_spec.shape[1]
-        mel_spec = np.pad(mel_spec, ((0, 0), (0, padding)), mode='constant')
-    elif mel_spec.shape[1] > expected_width:
-        mel_spec = mel_spec[:, :expected_width]
 
-    mel_spec = tf.transpose(mel_spec)
-    mel_spec = tf.expand_dims(mel_spec, axis=0)
-    mel_spec = tf.expand_dims(mel_spec, axis=-1)
+@tf.function(input_signature=[tf.TensorSpec([229, None], tf.float32)])
+def shape_to_input(mel_spec):
+    """[229, time] mel spectrogram -> [1, 626, 229, 1] model input, cropping or zero-padding the time axis"""
+    expected_width = 626
 
-    return mel_spec
+    mel_spec = mel_spec[:, :expected_width]
+    mel_spec = tf.pad(mel_spec, [[0, 0], [0, expected_width - tf.shape(mel_spec)[1]]])
+    return tf.reshape(tf.transpose(mel_spec), [1, expected_width, 229, 1])
 
 
 # =============================================================================
@@ -628,7 +792,8 @@ def upload_file_to_s3(local_path, s3_path, content_type):
             local_path,
             AWS_BUCKET_NAME,
             s3_path,
-            ExtraArgs={'ContentType': content_type}
+            ExtraArgs={'ContentType': content_type},
+            Config=S3_TRANSFER_CONFIG
         )
 
 
@@ -641,24 +806,51 @@ def clean_up_local_file(local_path):
         logger.debug(f"Cleanup warning: {e}")
 
 
+# Runs disk I/O that the response does not depend on, so it does not hold up the request
+_cleanup_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cleanup")
+
+# Output files still being written in the background, by filename; /api/download waits on these
+_pending_writes = {}
+_pending_writes_lock = threading.Lock()
+
+
+def _write_in_background(filename, fn, *args):
+    """Run a file-producing task on the I/O pool and register it so downloads can wait for it"""
+    future = _cleanup_pool.submit(fn, *args)
+    with _pending_writes_lock:
+        _pending_writes[filename] = future
+
+    def _forget(done):
+        with _pending_writes_lock:
+            if _pending_writes.get(filename) is done:
+                del _pending_writes[filename]
+
+    future.add_done_callback(_forget)
+    return future
+
+
+def _write_transcription_midi(notes, midi_output_path, audio_digest=None):
+    """Write the MIDI for a transcription and, if a digest is given, add the result to the cache"""
+    create_midi_from_notes(notes, midi_output_path)
+    logger.info(f"MIDI file created at: {midi_output_path}")
+
+    if audio_digest is not None:
+        with open(midi_output_path, 'rb') as f:
+            transcription_cache.put(audio_digest, notes, f.read())
+
+
 def save_metadata_to_s3(metadata, s3_path):
     """Save metadata JSON to S3 - ORIGINAL"""
     if not s3_client:
         return
 
-    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as temp_file:
-        json.dump(metadata, temp_file, indent=2)
-        temp_file_path = temp_file.name
-
-    s3_client.upload_file(
-        temp_file_path,
-        AWS_BUCKET_NAME,
-        s3_path,
-        ExtraArgs={'ContentType': 'application/json'}
+    s3_client.put_object(
+        Bucket=AWS_BUCKET_NAME,
+        Key=s3_path,
+        Body=orjson.dumps(metadata, option=orjson.OPT_INDENT_2),
+        ContentType='application/json'
     )
 
-    os.remove(temp_file_path)
-
 
 def save_generated_files_to_s3(user_id, recording_id, result_data):
     """Save generated MIDI and PDF files to S3 and update metadata - ORIGINAL"""
@@ -676,7 +868,7 @@ def save_generated_files_to_s3(user_id, recording_id, result_data):
                 Bucket=AWS_BUCKET_NAME,
                 Key=metadata_key
             )
-            metadata = json.loads(metadata_response['Body'].read().decode('utf-8'))
+            metadata = orjson.loads(metadata_response['Body'].read())
         except Exception as e:
             logger.error(f"❌ Could not load metadata: {e}")
             return result_data
@@ -807,7 +999,8 @@ def split_audio_into_chunks(audio_path: str) -> List[Tuple[str, float, float]]:
     """
     try:
         # Load the full audio to get its duration
-        y, sr = librosa.load(audio_path, sr=16000)
+        sr = 16000
+        y = load_audio(audio_path, sr=sr)
         total_duration = len(y) / sr
         
         logger.info(f"🎵 Audio duration: {total_duration:.1f} seconds")
@@ -838,7 +1031,6 @@ def split_audio_into_chunks(audio_path: str) -> List[Tuple[str, float, float]]:
             chunk_path = os.path.join(UPLOAD_FOLDER, chunk_filename)
             
             # Save the chunk as WAV file
-            import soundfile as sf
             sf.write(chunk_path, chunk_audio, sr)
             
             chunks.append((chunk_path, start_time, end_time))
@@ -882,8 +1074,7 @@ def process_single_chunk(chunk_path: str, start_offset: float) -> List[Dict]:
         mel_spec = process_spectrogram_for_model(mel_spec)
         
         # Get current model and make prediction
-        current_model = stable_model_loader.get_model()
-        predictions = current_model.predict(mel_spec)
+        predictions = model_batcher.submit(mel_spec).result()
         
         # Extract notes from predictions
         notes = extract_notes_from_predictions(predictions)
@@ -970,8 +1161,7 @@ def process_long_audio_in_chunks(audio_path: str) -> List[Dict]:
             logger.info("📋 Single chunk processing")
             mel_spec = extract_mel_spectrogram(audio_path)
             mel_spec = process_spectrogram_for_model(mel_spec)
-            current_model = stable_model_loader.get_model()
-            predictions = current_model.predict(mel_spec)
+            predictions = model_batcher.submit(mel_spec).result()
             return extract_notes_from_predictions(predictions)
         
         # Process each chunk
@@ -1013,8 +1203,7 @@ def process_long_audio_in_chunks(audio_path: str) -> List[Dict]:
         logger.info("🔄 Falling back to regular processing...")
         mel_spec = extract_mel_spectrogram(audio_path)
         mel_spec = process_spectrogram_for_model(mel_spec)
-        current_model = stable_model_loader.get_model()
-        predictions = current_model.predict(mel_spec)
+        predictions = model_batcher.submit(mel_spec).result()
         return extract_notes_from_predictions(predictions)
 
 
@@ -1024,6 +1213,7 @@ def perform_transcription_with_chunking(audio_file_path, title="Piano Transcript
     Enhanced transcription function that handles long audio files by chunking.
     This replaces your original perform_transcription function.
     """
+    wav_path = None
     try:
         logger.info(f"🎵 Starting enhanced transcription for: {audio_file_path}")
 
@@ -1035,7 +1225,8 @@ def perform_transcription_with_chunking(audio_file_path, title="Piano Transcript
             wav_path = audio_file_path
 
         # Check audio duration to decide processing method
-        y, sr = librosa.load(wav_path, sr=16000)
+        sr = 16000
+        y = load_audio(wav_path, sr=sr)
         total_duration = len(y) / sr
         
         logger.info(f"⏱️ Audio duration: {total_duration:.1f} seconds")
@@ -1048,8 +1239,7 @@ def perform_transcription_with_chunking(audio_file_path, title="Piano Transcript
             # Use original processing method for short audio
             mel_spec = extract_mel_spectrogram(wav_path)
             mel_spec = process_spectrogram_for_model(mel_spec)
-            current_model = stable_model_loader.get_model()
-            predictions = current_model.predict(mel_spec)
+            predictions = model_batcher.submit(mel_spec).result()
             notes = extract_notes_from_predictions(predictions)
 
         logger.info(f"🎼 Total notes extracted: {len(notes)}")
@@ -1060,7 +1250,7 @@ def perform_transcription_with_chunking(audio_file_path, title="Piano Transcript
         create_midi_from_notes(notes, midi_path)
 
         # Generate sheet music if possible
-        musescore_available, musescore_info = check_musescore_installation()
+        musescore_available, musescore_info = _MUSESCORE_STATUS
         sheet_music_result = None
 
         if musescore_available and os.path.exists(midi_path):
@@ -1069,15 +1259,16 @@ def perform_transcription_with_chunking(audio_file_path, title="Piano Transcript
 
                 sheet_uuid = str(uuid.uuid4())
                 musicxml_filename = f"{sheet_uuid}.musicxml"
-                musicxml_path = os.path.join(OUTPUT_FOLDER, musicxml_filename)
+                # For a PDF the MusicXML is only written (as an intermediate) by the two-step fallback
+                musicxml_dir = (TEMP_DIR or OUTPUT_FOLDER) if sheet_format.lower() == 'pdf' else OUTPUT_FOLDER
+                musicxml_path = os.path.join(musicxml_dir, musicxml_filename)
 
                 pdf_filename = f"{sheet_uuid}.pdf"
                 pdf_path = os.path.join(OUTPUT_FOLDER, pdf_filename)
 
-                success, message = convert_midi_to_musicxml(midi_path, musicxml_path)
-
-                if success and sheet_format.lower() == 'pdf':
-                    pdf_success, pdf_message = convert_musicxml_to_pdf(musicxml_path, pdf_path)
+                if sheet_format.lower() == 'pdf':
+                    pdf_success, pdf_message = convert_midi_to_pdf(midi_path, musicxml_path, pdf_path)
+                    clean_up_local_file(musicxml_path)
 
                     if pdf_success:
                         sheet_music_result = {
@@ -1088,26 +1279,22 @@ def perform_transcription_with_chunking(audio_file_path, title="Piano Transcript
                         logger.info(f"✅ Full-length sheet music generated: {pdf_filename}")
                     else:
                         logger.error(f"❌ PDF generation failed: {pdf_message}")
-                elif success:
-                    sheet_music_result = {
-                        "fileUrl": f"/api/download/{musicxml_filename}",
-                        "format": "musicxml",
-                        "title": title
-                    }
-                    logger.info(f"✅ Full-length MusicXML generated: {musicxml_filename}")
                 else:
-                    logger.error(f"❌ Sheet music generation failed: {message}")
+                    success, message = convert_midi_to_musicxml(midi_path, musicxml_path)
+
+                    if success:
+                        sheet_music_result = {
+                            "fileUrl": f"/api/download/{musicxml_filename}",
+                            "format": "musicxml",
+                            "title": title
+                        }
+                        logger.info(f"✅ Full-length MusicXML generated: {musicxml_filename}")
+                    else:
+                        logger.error(f"❌ Sheet music generation failed: {message}")
 
             except Exception as sheet_e:
                 logger.error(f"❌ Sheet music generation error: {sheet_e}")
 
-        # Clean up temporary WAV file
-        try:
-            if wav_path != audio_file_path and os.path.exists(wav_path):
-                os.remove(wav_path)
-        except Exception as cleanup_e:
-            logger.warning(f"⚠️ Warning: Could not clean up temporary wav file: {cleanup_e}")
-
         result_data = {
             "success": True,
             "notes": notes,
@@ -1130,9 +1317,14 @@ def perform_transcription_with_chunking(audio_file_path, title="Piano Transcript
         import traceback
         traceback.print_exc()
         return False, None, str(e)
+    finally:
+        # The converted WAV is removed on the error paths too
+        if wav_path != audio_file_path:
+            clean_up_local_file(wav_path)
 
 def perform_transcription(audio_file_path, title="Piano Transcription", sheet_format="pdf", tempo=120):
     """Core transcription logic - ALL ORIGINAL FUNCTIONALITY"""
+    wav_path = None
     try:
         logger.info(f"🎵 Starting transcription for: {audio_file_path}")
 
@@ -1149,14 +1341,14 @@ def perform_transcription(audio_file_path, title="Piano Transcription", sheet_fo
 
         try:
             logger.info("🤖 Loading AI model...")
-            current_model = stable_model_loader.get_model()
+            stable_model_loader.get_model()
             logger.info("✅ Model loaded successfully for transcription")
         except Exception as model_e:
             logger.error(f"❌ Error loading model: {model_e}")
             return False, None, f"Model loading failed: {str(model_e)}"
 
         logger.info("🧠 Running AI model prediction...")
-        predictions = current_model.predict(mel_spec)
+        predictions = model_batcher.submit(mel_spec).result()
         logger.info("✅ Model prediction completed")
 
         logger.info(f"🔍 Model output debug:")
@@ -1176,7 +1368,7 @@ def perform_transcription(audio_file_path, title="Piano Transcription", sheet_fo
         midi_path = os.path.join(OUTPUT_FOLDER, midi_filename)
         create_midi_from_notes(notes, midi_path)
 
-        musescore_available, musescore_info = check_musescore_installation()
+        musescore_available, musescore_info = _MUSESCORE_STATUS
 
         sheet_music_result = None
 
@@ -1186,15 +1378,16 @@ def perform_transcription(audio_file_path, title="Piano Transcription", sheet_fo
 
                 sheet_uuid = str(uuid.uuid4())
                 musicxml_filename = f"{sheet_uuid}.musicxml"
-                musicxml_path = os.path.join(OUTPUT_FOLDER, musicxml_filename)
+                # For a PDF the MusicXML is only written (as an intermediate) by the two-step fallback
+                musicxml_dir = (TEMP_DIR or OUTPUT_FOLDER) if sheet_format.lower() == 'pdf' else OUTPUT_FOLDER
+                musicxml_path = os.path.join(musicxml_dir, musicxml_filename)
 
                 pdf_filename = f"{sheet_uuid}.pdf"
                 pdf_path = os.path.join(OUTPUT_FOLDER, pdf_filename)
 
-                success, message = convert_midi_to_musicxml(midi_path, musicxml_path)
-
-                if success and sheet_format.lower() == 'pdf':
-                    pdf_success, pdf_message = convert_musicxml_to_pdf(musicxml_path, pdf_path)
+                if sheet_format.lower() == 'pdf':
+                    pdf_success, pdf_message = convert_midi_to_pdf(midi_path, musicxml_path, pdf_path)
+                    clean_up_local_file(musicxml_path)
 
                     if pdf_success:
                         sheet_music_result = {
@@ -1205,25 +1398,22 @@ def perform_transcription(audio_file_path, title="Piano Transcription", sheet_fo
                         logger.info(f"✅ Sheet music generated: {pdf_filename}")
                     else:
                         logger.error(f"❌ PDF generation failed: {pdf_message}")
-                elif success:
-                    sheet_music_result = {
-                        "fileUrl": f"/api/download/{musicxml_filename}",
-                        "format": "musicxml",
-                        "title": title
-                    }
-                    logger.info(f"✅ MusicXML generated: {musicxml_filename}")
                 else:
-                    logger.error(f"❌ Sheet music generation failed: {message}")
+                    success, message = convert_midi_to_musicxml(midi_path, musicxml_path)
+
+                    if success:
+                        sheet_music_result = {
+                            "fileUrl": f"/api/download/{musicxml_filename}",
+                            "format": "musicxml",
+                            "title": title
+                        }
+                        logger.info(f"✅ MusicXML generated: {musicxml_filename}")
+                    else:
+                        logger.error(f"❌ Sheet music generation failed: {message}")
 
             except Exception as sheet_e:
                 logger.error(f"❌ Sheet music generation error: {sheet_e}")
 
-        try:
-            if wav_path != audio_file_path and os.path.exists(wav_path):
-                os.remove(wav_path)
-        except Exception as cleanup_e:
-            logger.warning(f"⚠️ Warning: Could not clean up temporary wav file: {cleanup_e}")
-
         result_data = {
             "success": True,
             "notes": notes,
@@ -1247,6 +1437,10 @@ def perform_transcription(audio_file_path, title="Piano Transcription", sheet_fo
         import traceback
         traceback.print_exc()
         return False, None, str(e)
+    finally:
+        # The converted WAV is removed on the error paths too
+        if wav_path != audio_file_path:
+            clean_up_local_file(wav_path)
 
 
 # =============================================================================
@@ -1325,7 +1519,7 @@ def hello():
 def check_musescore_status():
     """Check if MuseScore is available for sheet music generation - ORIGINAL"""
     try:
-        is_available, version_info = check_musescore_installation()
+        is_available, version_info = _MUSESCORE_STATUS
         return jsonify({
             "available": is_available,
             "version": version_info,
@@ -1524,7 +1718,7 @@ def get_user_recordings_enhanced(user_id):
                         Bucket=AWS_BUCKET_NAME,
                         Key=metadata_key
                     )
-                    metadata = json.loads(metadata_response['Body'].read().decode('utf-8'))
+                    metadata = orjson.loads(metadata_response['Body'].read())
 
                     recordings.append({
                         'recording_id': recording_id,
@@ -1596,7 +1790,7 @@ def update_recording_metadata(recording_id):
                 Bucket=AWS_BUCKET_NAME,
                 Key=metadata_key
             )
-            metadata = json.loads(metadata_response['Body'].read().decode('utf-8'))
+            metadata = orjson.loads(metadata_response['Body'].read())
             logger.info("📋 Loaded existing metadata")
         except Exception as e:
             logger.error(f"❌ Could not load existing metadata: {e}")
@@ -1670,7 +1864,7 @@ def generate_transcription_for_recording(user_id, recording_id):
                 Bucket=AWS_BUCKET_NAME,
                 Key=metadata_key
             )
-            metadata = json.loads(metadata_response['Body'].read().decode('utf-8'))
+            metadata = orjson.loads(metadata_response['Body'].read())
             logger.info("📋 Loaded recording metadata")
         except Exception as e:
             logger.error(f"❌ Could not load recording metadata: {e}")
@@ -1687,13 +1881,15 @@ def generate_transcription_for_recording(user_id, recording_id):
 
         try:
             audio_extension = audio_info.get('filename', 'audio.m4a').split('.')[-1]
+            # On disk, not TEMP_DIR: recordings (and the WAV converted next to them) can outgrow /dev/shm
             with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{audio_extension}') as temp_audio:
                 temp_audio_path = temp_audio.name
 
             s3_client.download_file(
                 AWS_BUCKET_NAME,
                 audio_s3_path,
-                temp_audio_path
+                temp_audio_path,
+                Config=S3_TRANSFER_CONFIG
             )
 
             logger.info(f"📥 Downloaded audio file for transcription: {temp_audio_path}")
@@ -1745,7 +1941,7 @@ def health_check():
         "status": "ok",
         "model_loaded": stable_model_loader.is_model_ready(),
         "timestamp": datetime.now().isoformat(),
-        "message": "Model loads on first recordings endpoint request"
+        "message": "Model loads and warms up in the background at startup"
     })
 
 
@@ -1818,7 +2014,7 @@ def convert_midi_to_sheet():
         format_type = request.form.get('format', 'pdf')
         title = request.form.get('title', 'Piano Sheet Music')
 
-        musescore_available, musescore_info = check_musescore_installation()
+        musescore_available, musescore_info = _MUSESCORE_STATUS
 
         if not musescore_available:
             return jsonify({
@@ -1833,26 +2029,22 @@ def convert_midi_to_sheet():
 
         if format_type.lower() == 'pdf':
             musicxml_filename = f"{os.path.splitext(filename)[0]}.musicxml"
-            musicxml_path = os.path.join(OUTPUT_FOLDER, musicxml_filename)
+            musicxml_path = os.path.join(TEMP_DIR or OUTPUT_FOLDER, musicxml_filename)
 
             pdf_filename = f"{os.path.splitext(filename)[0]}.pdf"
             pdf_path = os.path.join(OUTPUT_FOLDER, pdf_filename)
 
-            success, message = convert_midi_to_musicxml(midi_path, musicxml_path)
-
-            if success:
-                pdf_success, pdf_message = convert_musicxml_to_pdf(musicxml_path, pdf_path)
+            pdf_success, pdf_message = convert_midi_to_pdf(midi_path, musicxml_path, pdf_path)
+            clean_up_local_file(musicxml_path)
 
-                if pdf_success:
-                    sheet_music_result = {
-                        "fileUrl": f"/api/download/{pdf_filename}",
-                        "format": "pdf",
-                        "title": title
-                    }
-                else:
-                    return jsonify({"error": f"PDF conversion failed: {pdf_message}"}), 500
+            if pdf_success:
+                sheet_music_result = {
+                    "fileUrl": f"/api/download/{pdf_filename}",
+                    "format": "pdf",
+                    "title": title
+                }
             else:
-                return jsonify({"error": f"MusicXML conversion failed: {message}"}), 500
+                return jsonify({"error": f"PDF conversion failed: {pdf_message}"}), 500
         else:
             musicxml_filename = f"{os.path.splitext(filename)[0]}.musicxml"
             musicxml_path = os.path.join(OUTPUT_FOLDER, musicxml_filename)
@@ -1889,7 +2081,14 @@ def convert_midi_to_sheet():
 def download_midi(filename):
     """Download the generated MIDI file - ORIGINAL"""
     try:
-        file_path = os.path.join(OUTPUT_FOLDER, secure_filename(filename))
+        filename = secure_filename(filename)
+        file_path = os.path.join(OUTPUT_FOLDER, filename)
+
+        with _pending_writes_lock:
+            pending = _pending_writes.get(filename)
+        if pending is not None:
+            pending.result(timeout=30)
+
         if not os.path.exists(file_path):
             return jsonify({"error": "File not found"}), 404
         return send_file(file_path, as_attachment=True)
@@ -1913,61 +2112,64 @@ def process_audio():
     try:
         file_ext = os.path.splitext(file.filename)[1].lower()
         unique_filename = f"{uuid.uuid4()}_{secure_filename(file.filename)}"
-        audio_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-        file.save(audio_path)
-        logger.info(f"File saved at: {audio_path}")
 
-        wav_file_path = os.path.splitext(audio_path)[0] + ".wav"
-        if file_ext != '.wav':
-            logger.info(f"Converting {file_ext} to WAV...")
-            if file_ext == '.m4a':
-                success = convert_m4a_to_wav(audio_path, wav_file_path)
-            else:
-                success = convert_audio_to_wav(audio_path, wav_file_path)
+        # Read the upload once; hashing and decoding both work on the in-memory bytes
+        audio_bytes = file.stream.read()
+        logger.info(f"Received {len(audio_bytes)} bytes of {file_ext} audio")
 
-            if not success:
-                return jsonify({"error": "Failed to convert audio file"}), 500
+        if SAVE_UPLOADS:
+            audio_path = os.path.join(UPLOAD_FOLDER, unique_filename)
+            _cleanup_pool.submit(Path(audio_path).write_bytes, audio_bytes)
+
+        midi_filename = f"{os.path.splitext(unique_filename)[0]}.mid"
+        midi_output_path = os.path.join(OUTPUT_FOLDER, midi_filename)
+
+        audio_digest = TranscriptionCache.digest(audio_bytes)
+        cached = transcription_cache.get(audio_digest)
+        if cached is not None:
+            notes, midi_bytes = cached
+            _write_in_background(midi_filename, Path(midi_output_path).write_bytes, midi_bytes)
+            logger.info(f"♻️ Returning cached transcription ({len(notes)} notes) for {audio_digest[:12]}")
+            return jsonify({
+                "success": True,
+                "notes": notes,
+                "midi_file": f"/api/download/{midi_filename}"
+            }), 200
+
+        if file_ext == '.wav':
+            samples = load_audio(io.BytesIO(audio_bytes))
         else:
-            wav_file_path = audio_path
-
-        mel_spec = extract_mel_spectrogram(wav_file_path)
-        expected_height = 229
-        expected_width = 625
-
-        logger.info(f"Original spectrogram shape: {mel_spec.shape}")
-
-        if mel_spec.shape[0] != expected_height:
-            logger.info(f"Resizing frequency dimension from {mel_spec.shape[0]} to {expected_height}")
-            mel_spec = tf.image.resize(
-                tf.expand_dims(mel_spec, 0),
-                [expected_height, mel_spec.shape[1]]
-            )[0]
-
-        if mel_spec.shape[1] < expected_width:
-            padding = expected_width - mel_spec.shape[1]
-            mel_spec = np.pad(mel_spec, ((0, 0), (0, padding)), mode='constant')
-            logger.info(f"Padded time dimension to {mel_spec.shape}")
-        elif mel_spec.shape[1] > expected_width:
-            mel_spec = mel_spec[:, :expected_width]
-            logger.info(f"Trimmed time dimension to {mel_spec.shape}")
-
-        mel_spec = tf.transpose(mel_spec)
-        mel_spec = tf.expand_dims(mel_spec, axis=0)
-        mel_spec = tf.expand_dims(mel_spec, axis=-1)
+            logger.info(f"Decoding {file_ext} in memory...")
+            samples = decode_audio_with_ffmpeg(audio_bytes)
+            if samples is None:
+                return jsonify({"error": "Failed to convert audio file"}), 500
+
+        # Silent or near-silent upload (RMS below 1e-4): nothing to transcribe, skip the model
+        if samples.size == 0 or np.mean(samples * samples) < 1e-8:
+            logger.info("🔇 Upload is silent, returning no notes without running the model")
+            _write_in_background(midi_filename, create_midi_from_notes, [], midi_output_path)
+            return jsonify({
+                "success": True,
+                "notes": [],
+                "midi_file": f"/api/download/{midi_filename}"
+            }), 200
+
+        mel_spec = wav_to_mel(samples)
         logger.info(f"Spectrogram shape for model input: {mel_spec.shape}")
 
         try:
-            current_model = stable_model_loader.get_model()
-            logger.info("Model loaded successfully for processing")
             logger.info("Running model prediction...")
-            predictions = current_model.predict(mel_spec)
+            predictions = model_batcher.submit(mel_spec).result()
             logger.info("Model prediction completed")
-            notes = extract_notes_from_predictions(predictions)
+            # Postprocessing errors surface here too, so placeholder notes are never cached
+            notes = extract_notes_from_predictions(predictions, raise_on_error=True)
             logger.info(f"Extracted {len(notes)} notes")
+            cacheable = True
 
         except Exception as model_error:
             logger.error(f"Model failed: {model_error}, generating test notes...")
             logger.info("Creating test notes (C major scale)...")
+            cacheable = False
             notes = []
             for i, pitch in enumerate([60, 62, 64, 65, 67, 69, 71, 72]):
                 notes.append({
@@ -1977,7 +2179,7 @@ def process_audio():
                     "velocity": 0.8,
                     "velocity_midi": 100,
                     "pitch": pitch,
-                    "frequency": librosa.midi_to_hz(pitch)
+                    "frequency": float(MIDI_TO_HZ[pitch])
                 })
 
         logger.info("\n===== EXTRACTED NOTES SUMMARY =====")
@@ -1986,18 +2188,9 @@ def process_audio():
             logger.info(f"Time range: {notes[0]['time']:.2f}s to {notes[-1]['time']:.2f}s")
             logger.info(f"Pitch range: {min([n['pitch'] for n in notes])} to {max([n['pitch'] for n in notes])}")
 
-        midi_filename = f"{os.path.splitext(unique_filename)[0]}.mid"
-        midi_output_path = os.path.join(OUTPUT_FOLDER, midi_filename)
-        create_midi_from_notes(notes, midi_output_path)
-        logger.info(f"MIDI file created at: {midi_output_path}")
-
-        try:
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
-            if os.path.exists(wav_file_path) and wav_file_path != audio_path:
-                os.remove(wav_file_path)
-        except Exception as cleanup_e:
-            logger.warning(f"Warning: Could not clean up temporary files: {cleanup_e}")
+        # The client fetches the MIDI later through /api/download, so write it while the response goes out
+        _write_in_background(midi_filename, _write_transcription_midi, notes, midi_output_path,
+                             audio_digest if cacheable else None)
 
         return jsonify({
             "success": True,
@@ -0,0 +1,2 @@
+# Having a conftest here puts backend/ on sys.path, so tests import modules the way app.py does
+# (e.g. `from utils.utils import F1Score`). Run the suite from backend/: python -m pytest -q
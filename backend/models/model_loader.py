@@ -1,24 +1,94 @@
 import os
+import threading
+
+import numpy as np
 import tensorflow as tf
 
+# Output order of the Keras model (onset, frame, offset, velocity)
+MODEL_OUTPUT_NAMES = ['onset_dense', 'frame_dense', 'offset_dense', 'velocity_dense']
+
+# Spectrogram widths the backend feeds the model (chunked transcription / process-audio)
+WARMUP_INPUT_WIDTHS = [626, 625]
+
+
+class TFLiteModel:
+    """int8 TFLite export of the model exposing the same predict() interface as the SavedModel"""
+
+    def __init__(self, model_path):
+        self.interpreter = tf.lite.Interpreter(model_path=model_path)
+        self.runner = self.interpreter.get_signature_runner()
+        self.input_name, self.input_details = next(iter(self.runner.get_input_details().items()))
+        self.lock = threading.Lock()
+
+        # predict() returns the heads by their Keras names; an export with other output keys can't be used
+        output_names = set(self.runner.get_output_details())
+        missing = [name for name in MODEL_OUTPUT_NAMES if name not in output_names]
+        if missing:
+            raise ValueError(f"TFLite signature outputs {sorted(output_names)} are missing {missing}")
+
+    def _quantize(self, input_data):
+        """Quantize the log-mel input with the scale/zero point chosen at export time"""
+        input_data = np.asarray(input_data, dtype=np.float32)
+        scale, zero_point = self.input_details['quantization']
+        if self.input_details['dtype'] != np.int8 or scale == 0:
+            return input_data.astype(self.input_details['dtype'])
+        quantized = np.round(input_data / scale + zero_point)
+        return np.clip(quantized, -128, 127).astype(np.int8)
+
+    def predict(self, input_data):
+        input_data = self._quantize(input_data)
+
+        # The interpreter is not thread-safe; the signature runner resizes for the batch/time shape
+        with self.lock:
+            outputs = self.runner(**{self.input_name: input_data})
+
+        return [tf.convert_to_tensor(outputs[name]) for name in MODEL_OUTPUT_NAMES]
+
 
 class ModelLoader:
-    def __init__(self):
+    def __init__(self, warmup=True):
         # Model is stored directly in the Space
         self.local_model_path = "models/saved_model"
+        # Optional int8 export produced by utils/export_tflite.py, used on CPU-only hosts
+        self.tflite_model_path = "models/model_int8.tflite"
         self.model = None
+        self.lock = threading.Lock()
         print("ModelLoader initialized - ready for lazy loading")
 
+        if warmup:
+            threading.Thread(target=self._warmup, name="model-warmup", daemon=True).start()
+
     def get_model(self):
         """Get model, loading it if necessary (lazy loading)"""
         if self.model is None:
-            print("Model not loaded yet - loading now...")
-            self.load_model()
+            with self.lock:
+                if self.model is None:
+                    print("Model not loaded yet - loading now...")
+                    self.load_model()
         return self.model
 
+    def _warmup(self):
+        """Load the model in the background and run dummy predictions to trace it before the first request"""
+        try:
+            model = self.get_model()
+            for width in WARMUP_INPUT_WIDTHS:
+                model.predict(tf.zeros([1, width, 229, 1], dtype=tf.float32))
+            print("✅ Model warmed up")
+        except Exception as e:
+            print(f"⚠️ Model warmup failed: {e}")
+
     def load_model(self):
         """Load model from local files"""
         try:
+            if os.path.exists(self.tflite_model_path) and not tf.config.list_physical_devices('GPU'):
+                print(f"Loading int8 TFLite model from: {self.tflite_model_path}")
+                try:
+                    self.model = TFLiteModel(self.tflite_model_path)
+                    print("✅ TFLite model loaded successfully from local files")
+                    return
+                except (ValueError, RuntimeError) as e:
+                    print(f"⚠️ Unusable TFLite model, falling back to the SavedModel: {e}")
+
             print(f"Loading SavedModel from: {self.local_model_path}")
             
             # Check if model exists
@@ -28,10 +98,18 @@ class ModelLoader:
             # Load the model
             loaded_model = tf.saved_model.load(self.local_model_path)
 
-            # Add predict wrapper
+            # Add predict wrapper with a fixed signature so requests reuse one concrete function
+            @tf.function(input_signature=[tf.TensorSpec([None, None, 229, 1], tf.float32)])
             def predict_wrapper(input_data):
                 return loaded_model(input_data)
 
+            try:
+                predict_wrapper.get_concrete_function()
+            except (ValueError, TypeError) as e:
+                # The SavedModel was only traced for fixed shapes; let TF trace once per input shape
+                print(f"⚠️ Generic input signature not supported, tracing per shape: {e}")
+                predict_wrapper = tf.function(lambda input_data: loaded_model(input_data))
+
             loaded_model.predict = predict_wrapper
             self.model = loaded_model
             print("✅ Model loaded successfully from local files")
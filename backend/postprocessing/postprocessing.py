@@ -10,6 +10,11 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Lookup tables indexed by MIDI pitch: note name (60 -> "C4") and frequency in Hz
+_NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+MIDI_TO_NAME = [f"{_NOTE_NAMES[pitch % 12]}{pitch // 12 - 1}" for pitch in range(128)]
+MIDI_TO_HZ = librosa.midi_to_hz(np.arange(128))
+
 class MusicTranscriptionPostprocessor:
     """Simplified postprocessor for robust operation"""
     
@@ -18,13 +23,17 @@ class MusicTranscriptionPostprocessor:
                  frame_threshold=0.3,
                  min_note_duration=0.05,
                  max_note_duration=8.0,
-                 time_resolution=0.032):
+                 time_resolution=0.032,
+                 raise_on_error=False):
         
         self.onset_threshold = onset_threshold
         self.frame_threshold = frame_threshold
         self.min_note_duration = min_note_duration
         self.max_note_duration = max_note_duration
         self.time_resolution = time_resolution
+        # Re-raise processing errors instead of returning the placeholder notes, for callers
+        # that must not mistake the placeholder for a real result (e.g. the result cache)
+        self.raise_on_error = raise_on_error
 
     def process_predictions(self, predictions):
         """Main processing function - simplified and robust"""
@@ -33,9 +42,11 @@ class MusicTranscriptionPostprocessor:
             
             # Handle different output formats
             if len(predictions) >= 3:
-                onset_preds = predictions[0][0]
-                frame_preds = predictions[1][0] 
-                velocity_preds = predictions[2][0] if len(predictions) > 2 else None
+                # Contiguous float32, so the T x 88 passes don't silently upcast to float64
+                # (apart from the peak-picking buffer, as find_peaks only works in float64)
+                onset_preds = np.ascontiguousarray(predictions[0][0], dtype=np.float32)
+                frame_preds = np.ascontiguousarray(predictions[1][0], dtype=np.float32)
+                velocity_preds = np.ascontiguousarray(predictions[2][0], dtype=np.float32) if len(predictions) > 2 else None
             else:
                 raise ValueError(f"Expected at least 3 model outputs, got {len(predictions)}")
             
@@ -52,6 +63,8 @@ class MusicTranscriptionPostprocessor:
             
         except Exception as e:
             logger.error(f"❌ Postprocessing failed: {e}")
+            if self.raise_on_error:
+                raise
             return self._fallback_notes()
     
     def _extract_notes_simple(self, onset_preds, frame_preds, velocity_preds):
@@ -59,77 +72,74 @@ class MusicTranscriptionPostprocessor:
         notes = []
         
         try:
-            # Process each pitch
-            for pitch_idx in range(min(88, onset_preds.shape[1])):
-                onset_curve = onset_preds[:, pitch_idx]
-                frame_curve = frame_preds[:, pitch_idx]
-                
-                # Find onset peaks
-                peaks, _ = find_peaks(
-                    onset_curve,
-                    height=self.onset_threshold,
-                    distance=max(1, int(0.05 / self.time_resolution))  # Min 50ms apart
-                )
-                
-                # Create notes from peaks
-                for peak in peaks:
-                    # Find note duration using frame predictions
-                    duration = self._find_note_duration(peak, frame_curve)
-                    
-                    if duration >= self.min_note_duration:
-                        # Get velocity
-                        velocity = self._get_velocity(peak, pitch_idx, velocity_preds)
-                        
-                        # Create note
-                        midi_pitch = pitch_idx + 21  # Piano range starts at A0 (21)
-                        note = {
-                            "note_name": self._pitch_to_note_name(midi_pitch),
-                            "time": float(peak * self.time_resolution),
-                            "duration": float(duration),
-                            "velocity": float(velocity),
-                            "velocity_midi": int(min(127, max(1, velocity * 127))),
-                            "pitch": int(midi_pitch),
-                            "frequency": librosa.midi_to_hz(midi_pitch)
-                        }
-                        notes.append(note)
+            num_pitches = min(88, onset_preds.shape[1])
+            onset_preds = onset_preds[:, :num_pitches]
+
+            # Onset peaks for all pitches in one find_peaks call: the pitch curves are laid end to end
+            # with +inf gaps between them. A frame next to a gap is never a peak (just like the ends of
+            # a single curve), the gaps themselves fall outside the height range, and the gap width
+            # keeps the minimum distance (50ms) from reaching across pitches. find_peaks converts its input
+            # to float64 anyway, so the buffer is built in float64 rather than copied again
+            distance = max(1, int(0.05 / self.time_resolution))
+            num_frames = onset_preds.shape[0]
+            stride = num_frames + distance
+            curves = np.full((num_pitches, stride), np.inf)
+            curves[:, :num_frames] = onset_preds.T
+
+            peaks, _ = find_peaks(
+                curves.ravel(),
+                height=(self.onset_threshold, np.finfo(np.float64).max),
+                distance=distance
+            )
+            pitch_idxs, peak_frames = np.divmod(peaks.astype(np.int32), np.int32(stride))
+
+            if velocity_preds is not None:
+                velocities = np.clip(velocity_preds[peak_frames, pitch_idxs], 0.0, 1.0)
+            else:
+                velocities = np.full(len(peak_frames), 0.8, dtype=np.float32)
+
+            # For every (frame, pitch): the first frame from there on where the frame prediction is off
+            num_frames = frame_preds.shape[0]
+            below_threshold = frame_preds[:, :num_pitches] < self.frame_threshold
+            off_frames = np.where(below_threshold, np.arange(num_frames, dtype=np.int32)[:, None], np.int32(num_frames))
+            next_off_frame = np.minimum.accumulate(off_frames[::-1], axis=0)[::-1]
+
+            # Note durations, with a default length when the note never drops below threshold
+            note_off_frames = next_off_frame[peak_frames, pitch_idxs]
+            default_frames = np.minimum(int(0.5 / self.time_resolution), num_frames - peak_frames)
+            duration_frames = np.where(note_off_frames < num_frames, note_off_frames - peak_frames, default_frames)
+            durations = np.clip(duration_frames * self.time_resolution,
+                                self.min_note_duration, self.max_note_duration)
+
+            # Note fields as flat arrays, turned into dicts only once at the end
+            midi_pitches = pitch_idxs + 21  # Piano range starts at A0 (21)
+            times = peak_frames * self.time_resolution
+            # Scaled in float64 so the truncation to int matches int(float(velocity) * 127) exactly
+            velocities_midi = np.clip(velocities.astype(np.float64) * 127, 1, 127).astype(int)
+            frequencies = MIDI_TO_HZ[midi_pitches]
+
+            notes = [
+                {
+                    "note_name": MIDI_TO_NAME[midi_pitch],
+                    "time": time,
+                    "duration": duration,
+                    "velocity": velocity,
+                    "velocity_midi": velocity_midi,
+                    "pitch": midi_pitch,
+                    "frequency": frequency
+                }
+                for midi_pitch, time, duration, velocity, velocity_midi, frequency in zip(
+                    midi_pitches.tolist(), times.tolist(), durations.tolist(),
+                    velocities.tolist(), velocities_midi.tolist(), frequencies.tolist())
+            ]
         
         except Exception as e:
             logger.error(f"Note extraction error: {e}")
+            if self.raise_on_error:
+                raise
         
         return notes
     
-    def _find_note_duration(self, onset_frame, frame_curve):
-        """Find note duration using frame predictions"""
-        try:
-            # Look for where the frame prediction drops below threshold
-            remaining_frames = frame_curve[onset_frame:]
-            
-            # Find first point below threshold
-            below_threshold = np.where(remaining_frames < self.frame_threshold)[0]
-            
-            if len(below_threshold) > 0:
-                duration_frames = below_threshold[0]
-            else:
-                # Default duration if no clear ending
-                duration_frames = min(int(0.5 / self.time_resolution), len(remaining_frames))
-            
-            duration = duration_frames * self.time_resolution
-            return min(self.max_note_duration, max(self.min_note_duration, duration))
-            
-        except Exception:
-            return 0.5  # Default duration
-    
-    def _get_velocity(self, onset_frame, pitch_idx, velocity_preds):
-        """Get velocity for the note"""
-        try:
-            if velocity_preds is not None:
-                raw_velocity = velocity_preds[onset_frame, pitch_idx]
-                return float(np.clip(raw_velocity, 0.0, 1.0))
-            else:
-                return 0.8  # Default velocity
-        except Exception:
-            return 0.8
-    
     def _clean_notes(self, notes):
         """Clean and filter notes"""
         if not notes:
@@ -150,10 +160,7 @@ class MusicTranscriptionPostprocessor:
     
     def _pitch_to_note_name(self, pitch):
         """Convert MIDI pitch to note name"""
-        note_names = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-        octave = (pitch // 12) - 1
-        note = note_names[pitch % 12]
-        return f"{note}{octave}"
+        return MIDI_TO_NAME[pitch]
     
     def _fallback_notes(self):
         """Fallback notes if processing fails"""
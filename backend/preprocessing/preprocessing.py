@@ -0,0 +1,119 @@
+"""
+Feature extraction for piano transcription
+Audio loading and the log-mel spectrogram the model was trained on, without the server's startup side effects
+"""
+
+import functools
+import logging
+
+import numpy as np
+import librosa
+import scipy.fft
+from scipy.signal import get_window
+import soundfile as sf
+import tensorflow as tf
+
+try:
+    import samplerate
+    _samplerate_error = None
+except (ImportError, OSError) as e:
+    # OSError: the package imports, but cffi cannot load the system libsamplerate
+    samplerate = None
+    _samplerate_error = e
+
+logger = logging.getLogger(__name__)
+
+if samplerate is None:
+    logger.warning(f"⚠️ libsamplerate unavailable, resampling audio with librosa instead: {_samplerate_error}")
+
+
+def load_audio(audio_path, sr=16000):
+    """Load mono float32 audio (from a path or file-like object) at the target rate using soundfile + libsamplerate"""
+    try:
+        y, orig_sr = sf.read(audio_path, dtype='float32', always_2d=False)
+    except Exception as e:
+        # Formats libsndfile can't read (e.g. MP4/M4A) are decoded by librosa's audioread backend
+        logger.debug(f"soundfile could not read the audio, falling back to librosa: {e}")
+        if hasattr(audio_path, 'seek'):
+            audio_path.seek(0)
+        y, _ = librosa.load(audio_path, sr=sr)
+        return y
+
+    if y.ndim == 2:
+        y = y.mean(axis=1)
+    if orig_sr != sr:
+        if samplerate is not None:
+            y = samplerate.resample(y, sr / orig_sr, 'sinc_fastest').astype(np.float32, copy=False)
+        else:
+            # Without libsamplerate (warned about at startup), resample the way librosa.load does
+            y = librosa.resample(y, orig_sr=orig_sr, target_sr=sr)
+    return y
+
+
+@functools.lru_cache(maxsize=None)
+def _stft_window(n_fft):
+    """Periodic Hann window, as used by librosa.stft"""
+    return get_window('hann', n_fft, fftbins=True).astype(np.float32)
+
+
+@functools.lru_cache(maxsize=None)
+def _mel_filterbank(sr, n_fft, n_mels):
+    """Slaney mel filterbank, as used by librosa.feature.melspectrogram"""
+    return librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels).astype(np.float32)
+
+
+def extract_mel_spectrogram(audio_path, sr=16000, n_mels=229, hop_length=512, n_fft=2048):
+    """Extract mel spectrogram - ORIGINAL"""
+    y = load_audio(audio_path, sr=sr)
+    return compute_mel_spectrogram(y, sr=sr, n_mels=n_mels, hop_length=hop_length, n_fft=n_fft)
+
+
+def compute_mel_spectrogram(y, sr=16000, n_mels=229, hop_length=512, n_fft=2048):
+    """
+    [n_mels, frames] log-mel spectrogram of mono samples, matching
+    librosa.power_to_db(librosa.feature.melspectrogram(...), ref=np.max) - the features the model was trained on
+    """
+    y = np.asarray(y, dtype=np.float32)
+
+    # Centered, zero-padded frames like librosa.stft(center=True), transformed on all cores
+    y_padded = np.pad(y, n_fft // 2, mode='constant')
+    frames = np.lib.stride_tricks.sliding_window_view(y_padded, n_fft)[::hop_length] * _stft_window(n_fft)
+    spectrum = scipy.fft.rfft(frames, n=n_fft, axis=1, workers=-1)
+    power_spec = spectrum.real ** 2 + spectrum.imag ** 2
+
+    mel_spec = _mel_filterbank(sr, n_fft, n_mels) @ power_spec.T
+    mel_spec = mel_spec.astype(np.float32, copy=False)
+
+    # Same as librosa.power_to_db(mel_spec, ref=np.max) with its defaults (amin=1e-10, top_db=80)
+    log_mel_spec = 10.0 * np.log10(np.maximum(mel_spec, 1e-10) / max(float(mel_spec.max()), 1e-10))
+    return np.maximum(log_mel_spec, log_mel_spec.max() - 80.0)
+
+
+# Slaney mel weights as a graph constant, [1 + n_fft // 2, n_mels]
+_MEL_WEIGHTS = tf.constant(_mel_filterbank(16000, 2048, 229).T)
+
+
+@tf.function(input_signature=[tf.TensorSpec([None], tf.float32)])
+def wav_to_mel(wave):
+    """16 kHz waveform -> [1, 625, 229, 1] log-mel model input, computed in a single TF graph"""
+    n_fft = 2048
+    hop_length = 512
+    expected_width = 625
+
+    # Centered, zero-padded frames like librosa.stft(center=True); the Hann window is periodic
+    wave = tf.pad(wave, [[n_fft // 2, n_fft // 2]])
+    stft = tf.signal.stft(wave, frame_length=n_fft, frame_step=hop_length, fft_length=n_fft,
+                          window_fn=tf.signal.hann_window)
+    power_spec = tf.math.square(tf.abs(stft))
+    mel_spec = tf.tensordot(power_spec, _MEL_WEIGHTS, 1)
+
+    # Same dB scaling as compute_mel_spectrogram (power_to_db with ref=max, amin=1e-10, top_db=80)
+    db_scale = 10.0 / np.log(10.0)
+    log_mel_spec = db_scale * (tf.math.log(tf.maximum(mel_spec, 1e-10)) -
+                               tf.math.log(tf.maximum(tf.reduce_max(mel_spec), 1e-10)))
+    log_mel_spec = tf.maximum(log_mel_spec, tf.reduce_max(log_mel_spec) - 80.0)
+
+    # Crop or zero-pad the time axis to the model width; frames are already time-major
+    log_mel_spec = log_mel_spec[:expected_width]
+    log_mel_spec = tf.pad(log_mel_spec, [[0, expected_width - tf.shape(log_mel_spec)[0]], [0, 0]])
+    return tf.reshape(log_mel_spec, [1, expected_width, 229, 1])
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from scipy.signal import find_peaks
+
+from postprocessing.postprocessing import MusicTranscriptionPostprocessor
+
+
+def _predictions(onset_preds):
+    frame_preds = np.zeros_like(onset_preds)
+    velocity_preds = np.full_like(onset_preds, 0.5)
+    return [onset_preds[np.newaxis], frame_preds[np.newaxis], velocity_preds[np.newaxis]]
+
+
+def _onset_frames(postprocessor, onset_preds):
+    notes = postprocessor.process_predictions(_predictions(onset_preds.astype(np.float32)))
+    return sorted((note["pitch"] - 21, round(note["time"] / postprocessor.time_resolution)) for note in notes)
+
+
+def test_plateau_peaks_match_find_peaks():
+    postprocessor = MusicTranscriptionPostprocessor()
+    onset_preds = np.zeros((12, 88), dtype=np.float32)
+    onset_preds[:, 0] = [0, .2, .9, .9, 1., .1, 0, 0, 0, 0, 0, 0]   # rising plateau: one peak, at the 1.0
+    onset_preds[:, 1] = [0, .5, 1., 1., 1., .2, 0, 0, 0, 0, 0, 0]   # flat top: peak in the middle
+    onset_preds[:, 2] = [1., 1., .2, 0, 0, 0, 0, 0, 0, .4, .8, .8]  # plateaus touching either end: no peaks
+
+    assert _onset_frames(postprocessor, onset_preds) == [(0, 4), (1, 3)]
+
+
+def _per_pitch_find_peaks(onset_preds, threshold, distance):
+    return sorted(
+        (pitch, int(peak))
+        for pitch in range(onset_preds.shape[1])
+        for peak in find_peaks(onset_preds[:, pitch], height=threshold, distance=distance)[0]
+    )
+
+
+def test_peaks_match_per_pitch_find_peaks():
+    rng = np.random.default_rng(0)
+
+    # Default 32 ms resolution (distance of one frame): coarsely quantized noise has plenty of plateaus
+    postprocessor = MusicTranscriptionPostprocessor()
+    onset_preds = np.round(rng.random((200, 88)) * 4) / 4
+    assert _onset_frames(postprocessor, onset_preds) == _per_pitch_find_peaks(onset_preds, 0.3, 1)
+
+    # 10 ms resolution (distance of five frames); continuous values, since find_peaks itself breaks
+    # ties between equally high peaks in an arbitrary order
+    postprocessor = MusicTranscriptionPostprocessor(time_resolution=0.01)
+    onset_preds = rng.random((200, 88)).astype(np.float32)
+    assert _onset_frames(postprocessor, onset_preds) == _per_pitch_find_peaks(onset_preds, 0.3, 5)
+
+
+def test_raise_on_error_skips_fallback_notes():
+    malformed = [np.zeros((1, 10, 88), dtype=np.float32)]
+
+    assert MusicTranscriptionPostprocessor().process_predictions(malformed)
+    with pytest.raises(ValueError):
+        MusicTranscriptionPostprocessor(raise_on_error=True).process_predictions(malformed)
+
+
+def test_velocity_midi_truncates_like_python_floats():
+    # float32(0.64566928) * 127 rounds up to 82.0 in float32, but is just below 82 in float64
+    velocity = np.float32(0.6456692814826965)
+    onset_preds = np.zeros((12, 88), dtype=np.float32)
+    onset_preds[4, 0] = 1.0
+    predictions = _predictions(onset_preds)
+    predictions[2][0, 4, 0] = velocity
+
+    [note] = MusicTranscriptionPostprocessor().process_predictions(predictions)
+    assert note["velocity_midi"] == int(float(velocity) * 127) == 81
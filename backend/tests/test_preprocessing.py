@@ -0,0 +1,83 @@
+import io
+
+import librosa
+import numpy as np
+import pytest
+import soundfile as sf
+
+from preprocessing.preprocessing import compute_mel_spectrogram, extract_mel_spectrogram, wav_to_mel
+
+SR = 16000
+HOP_LENGTH = 512
+MODEL_WIDTH = 625
+
+
+def _librosa_log_mel(y):
+    """The features the model was trained on"""
+    mel_spec = librosa.feature.melspectrogram(y=y, sr=SR, n_mels=229, hop_length=HOP_LENGTH, n_fft=2048)
+    return librosa.power_to_db(mel_spec, ref=np.max)
+
+
+def _noise(num_samples, seed=0):
+    return np.random.default_rng(seed).uniform(-0.5, 0.5, num_samples).astype(np.float32)
+
+
+# Shorter than one 2048-sample frame, not a multiple of the hop, and an exact number of hops
+@pytest.mark.filterwarnings('ignore:n_fft=2048 is too large')
+@pytest.mark.parametrize('num_samples', [700, 2047, 3 * SR + 123, 40 * HOP_LENGTH])
+def test_mel_spectrogram_matches_librosa(num_samples):
+    y = _noise(num_samples)
+    expected = _librosa_log_mel(y)
+    actual = compute_mel_spectrogram(y)
+
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, atol=1e-3)
+
+
+def test_extract_mel_spectrogram_reads_audio_like_librosa():
+    y = _noise(2 * SR + 300)
+    wav = io.BytesIO()
+    sf.write(wav, y, SR, format='WAV', subtype='FLOAT')
+    wav.seek(0)
+
+    np.testing.assert_allclose(extract_mel_spectrogram(wav), _librosa_log_mel(y), atol=1e-3)
+
+
+def _silence_then_noise():
+    y = _noise(2 * SR)
+    y[:SR] = 0.0
+    return y
+
+
+# Silence only, and audio so quiet it falls under power_to_db's amin floor (1e-10), exercise the floor;
+# silence followed by noise spans more than top_db, exercising the 80 dB clamp
+@pytest.mark.parametrize('y', [
+    np.zeros(SR, dtype=np.float32),
+    _noise(SR) * 1e-8,
+    _silence_then_noise(),
+], ids=['silence', 'below-amin', 'silence-then-noise'])
+def test_db_scaling_matches_librosa(y):
+    expected = _librosa_log_mel(y)
+    actual = compute_mel_spectrogram(y)
+
+    np.testing.assert_allclose(actual, expected, atol=1e-3)
+
+
+def test_db_scaling_clamps_to_top_db():
+    log_mel_spec = compute_mel_spectrogram(_silence_then_noise())
+
+    assert log_mel_spec.max() == 0.0
+    assert log_mel_spec.min() == pytest.approx(-80.0)
+
+
+# /process-audio feeds wav_to_mel's output to the model: it must be the same features, cropped or zero-padded
+@pytest.mark.parametrize('seconds', [3.3, 20.0, 27.1])
+def test_wav_to_mel_matches_mel_spectrogram(seconds):
+    y = _noise(int(seconds * SR))
+    expected = compute_mel_spectrogram(y).T[:MODEL_WIDTH]
+    expected = np.pad(expected, [(0, MODEL_WIDTH - len(expected)), (0, 0)])
+
+    actual = wav_to_mel(y).numpy()
+
+    assert actual.shape == (1, MODEL_WIDTH, 229, 1)
+    np.testing.assert_allclose(actual[0, :, :, 0], expected, atol=1e-3)
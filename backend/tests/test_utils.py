@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from utils.utils import F1Score, FocalLoss, WeightedBinaryCrossentropy
+
+
+def _piano_roll_batches(num_batches=2, shape=(2, 50, 88), seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(num_batches):
+        y_true = (rng.random(shape) < 0.2).astype(np.float32)
+        y_pred = rng.random(shape).astype(np.float32)
+        yield y_true, y_pred
+
+
+def _baseline_weighted_bce(pos_weight):
+    def loss(y_true, y_pred):
+        y_pred = tf.clip_by_value(y_pred, 1e-7, 1 - 1e-7)
+        loss_pos = -pos_weight * y_true * tf.math.log(y_pred)
+        loss_neg = -(1 - y_true) * tf.math.log(1 - y_pred)
+        return tf.reduce_mean(loss_pos + loss_neg)
+    return loss
+
+
+def _baseline_focal(gamma, alpha):
+    def loss(y_true, y_pred):
+        y_pred = tf.clip_by_value(y_pred, 1e-7, 1 - 1e-7)
+        bce = -y_true * tf.math.log(y_pred) - (1 - y_true) * tf.math.log(1 - y_pred)
+        p_t = y_true * y_pred + (1 - y_true) * (1 - y_pred)
+        alpha_factor = y_true * alpha + (1 - y_true) * (1 - alpha)
+        return tf.reduce_mean(alpha_factor * tf.pow(1 - p_t, gamma) * bce)
+    return loss
+
+
+def _loss_inputs(from_logits, seed=0):
+    rng = np.random.default_rng(seed)
+    y_true = (rng.random((2, 50, 88)) < 0.2).astype(np.float32)
+    logits = rng.uniform(-4.0, 4.0, size=y_true.shape).astype(np.float32)
+    probabilities = tf.sigmoid(logits)
+    return y_true, (logits if from_logits else probabilities), probabilities
+
+
+@pytest.mark.parametrize('from_logits', [False, True])
+def test_weighted_bce_matches_baseline(from_logits):
+    y_true, y_pred, probabilities = _loss_inputs(from_logits)
+    loss = WeightedBinaryCrossentropy(pos_weight=3.0, from_logits=from_logits)
+    expected = _baseline_weighted_bce(3.0)(y_true, probabilities)
+    np.testing.assert_allclose(loss(y_true, y_pred).numpy(), expected.numpy(), rtol=1e-5)
+
+
+@pytest.mark.parametrize('from_logits', [False, True])
+@pytest.mark.parametrize('gamma', [1.0, 2.0, 2.5, 3.0, 1.5])
+def test_focal_loss_matches_baseline(gamma, from_logits):
+    y_true, y_pred, probabilities = _loss_inputs(from_logits)
+    loss = FocalLoss(gamma=gamma, alpha=0.25, from_logits=from_logits)
+    expected = _baseline_focal(gamma, 0.25)(y_true, probabilities)
+    np.testing.assert_allclose(loss(y_true, y_pred).numpy(), expected.numpy(), rtol=1e-5)
+
+
+@pytest.mark.parametrize('compute_dtype', ['float16', 'bfloat16'])
+def test_16bit_loss_keeps_confident_misses_large(compute_dtype):
+    # A 2**-7 floor on p would cap each missed note's loss at 7 * log(2), about 4.85
+    y_true = np.ones((1, 4, 88), dtype=np.float32)
+    y_pred = np.full_like(y_true, 1e-4)
+    loss = WeightedBinaryCrossentropy(pos_weight=1.0, compute_dtype=compute_dtype)
+    assert loss(y_true, y_pred).numpy() > 8.0
+
+
+@pytest.mark.parametrize('loss', [
+    WeightedBinaryCrossentropy(pos_weight=3.0, from_logits=True, compute_dtype='bfloat16'),
+    FocalLoss(gamma=2.5, alpha=0.4),
+])
+def test_loss_get_config_round_trips(loss):
+    restored = type(loss).from_config(loss.get_config())
+    assert restored.get_config() == loss.get_config()
+
+    y_true, y_pred, _ = _loss_inputs(loss.from_logits)
+    np.testing.assert_allclose(restored(y_true, y_pred).numpy(), loss(y_true, y_pred).numpy())
+
+
+def test_f1_score_matches_precision_and_recall():
+    f1 = F1Score(threshold=0.3)
+    precision = tf.keras.metrics.Precision(thresholds=0.3)
+    recall = tf.keras.metrics.Recall(thresholds=0.3)
+    for y_true, y_pred in _piano_roll_batches():
+        for metric in (f1, precision, recall):
+            metric.update_state(y_true, y_pred)
+
+    p = precision.result().numpy()
+    r = recall.result().numpy()
+    np.testing.assert_allclose(f1.result().numpy(), 2 * p * r / (p + r), rtol=1e-6)
+
+    f1.reset_state()
+    assert f1.result().numpy() == 0.0
+
+
+def test_f1_score_sample_weight_matches_precision_and_recall():
+    f1 = F1Score(threshold=0.3)
+    precision = tf.keras.metrics.Precision(thresholds=0.3)
+    recall = tf.keras.metrics.Recall(thresholds=0.3)
+    weight = np.array([0.5, 2.0], dtype=np.float32)
+    for y_true, y_pred in _piano_roll_batches():
+        f1.update_state(y_true, y_pred, sample_weight=weight)
+        per_element = np.broadcast_to(weight[:, None, None], y_pred.shape)
+        precision.update_state(y_true, y_pred, sample_weight=per_element)
+        recall.update_state(y_true, y_pred, sample_weight=per_element)
+
+    p = precision.result().numpy()
+    r = recall.result().numpy()
+    np.testing.assert_allclose(f1.result().numpy(), 2 * p * r / (p + r), rtol=1e-6)
+
+
+def test_f1_score_rejects_high_rank_sample_weight():
+    y_true, y_pred = next(_piano_roll_batches(num_batches=1))
+    with pytest.raises(ValueError):
+        F1Score().update_state(y_true, y_pred, sample_weight=np.ones(y_pred.shape + (1,)))
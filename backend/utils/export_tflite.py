@@ -0,0 +1,50 @@
+import glob
+import sys
+
+import librosa
+import numpy as np
+import tensorflow as tf
+
+# Model info
+saved_model_path = "models/saved_model"
+tflite_model_path = "models/model_int8.tflite"
+
+# Folder with a few representative piano recordings (WAV) used to calibrate the int8 ranges
+calibration_dir = sys.argv[1] if len(sys.argv) > 1 else "calibration_audio"
+calibration_files = sorted(glob.glob(f"{calibration_dir}/*.wav"))[:20]
+
+if not calibration_files:
+    raise SystemExit(f"No calibration WAV files found in: {calibration_dir}")
+
+
+def representative_dataset():
+    """Yield model inputs computed exactly like the backend's extract_mel_spectrogram"""
+    for audio_path in calibration_files:
+        y, _ = librosa.load(audio_path, sr=16000)
+        mel_spec = librosa.feature.melspectrogram(y=y, sr=16000, n_mels=229, hop_length=512, n_fft=2048)
+        log_mel_spec = librosa.power_to_db(mel_spec, ref=np.max)
+
+        model_input = np.zeros((229, 626), dtype=np.float32)
+        width = min(log_mel_spec.shape[1], 626)
+        model_input[:, :width] = log_mel_spec[:, :width]
+
+        yield [model_input.T[np.newaxis, :, :, np.newaxis]]
+
+
+# Post-training int8 quantization; the input is int8 so the log-mel can be fed quantized
+converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_path)
+converter.optimizations = [tf.lite.Optimize.DEFAULT]
+converter.representative_dataset = representative_dataset
+converter.target_spec.supported_types = [tf.int8]
+converter.target_spec.supported_ops = [
+    tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
+    tf.lite.OpsSet.SELECT_TF_OPS  # LSTM/attention ops without an int8 builtin
+]
+converter.inference_input_type = tf.int8
+
+tflite_model = converter.convert()
+
+with open(tflite_model_path, 'wb') as f:
+    f.write(tflite_model)
+
+print(f"int8 model written to: {tflite_model_path} ({len(tflite_model) / 1e6:.1f} MB)")
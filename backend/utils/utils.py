@@ -1,54 +1,241 @@
 import tensorflow as tf
 
-def weighted_binary_crossentropy(pos_weight):
+
+# Every loss is fed [batch, frames, 88 pitches] float32 tensors; a fixed signature keeps one trace
+PIANO_ROLL_SIGNATURE = [tf.TensorSpec([None, None, 88], tf.float32)] * 2
+
+
+# Smallest normal value of each 16-bit float; numpy's finfo, which tf.experimental.numpy.finfo wraps, rejects bfloat16
+_TINY_16BIT = {tf.float16: 2.0 ** -14, tf.bfloat16: 2.0 ** -126}
+
+
+def _clip_bounds(dtype):
+    """
+    Probability clip range; 1 - 1e-7 rounds to 1.0 in 16-bit floats, so those need a wider upper margin,
+    while the lower one only has to keep p above zero and can stay at the smallest normal value
+    """
+    if dtype.size >= 4:
+        return 1e-7, 1.0 - 1e-7
+    return _TINY_16BIT[dtype], 1.0 - 2.0 ** -7
+
+
+def _mean_float32(loss):
+    """Mean in float32, as a sum scaled by 1/N that XLA folds into the reduction's output write"""
+    loss = tf.cast(loss, tf.float32)
+    return tf.reduce_sum(loss) * (1.0 / tf.cast(tf.size(loss), tf.float32))
+
+
+class _PianoRollLoss(tf.keras.losses.Loss):
+    """
+    Shared plumbing for the piano-roll losses: subclasses set their hyperparameters before calling
+    this __init__ and implement _elementwise_loss on flat tensors in the compute dtype
+    With from_logits=True y_pred holds pre-sigmoid logits
+    compute_dtype (e.g. tf.bfloat16) runs the elementwise part at lower precision; the mean is always float32
+    """
+
+    def __init__(self, from_logits=False, compute_dtype=None, **kwargs):
+        super(_PianoRollLoss, self).__init__(**kwargs)
+        self.from_logits = from_logits
+        self.compute_dtype = tf.as_dtype(compute_dtype) if compute_dtype is not None else None
+
+        # XLA fuses the clip, logs, products and mean into a single kernel; tracing now, with
+        # this run's hyperparameters baked in, means the first training step doesn't pay for it
+        self._loss = tf.function(self._compute, input_signature=PIANO_ROLL_SIGNATURE, jit_compile=True)
+        self._loss.get_concrete_function()
+
+    def call(self, y_true, y_pred):
+        return self._loss(tf.cast(y_true, tf.float32), tf.cast(y_pred, tf.float32))
+
+    def _compute(self, y_true, y_pred):
+        # Elementwise math plus a full reduction: a flat view lets XLA emit one 1-D loop
+        y_true = tf.reshape(y_true, [-1])
+        y_pred = tf.reshape(y_pred, [-1])
+        if self.compute_dtype is not None:
+            y_true = tf.cast(y_true, self.compute_dtype)
+            y_pred = tf.cast(y_pred, self.compute_dtype)
+        return _mean_float32(self._elementwise_loss(y_true, y_pred))
+
+    def _elementwise_loss(self, y_true, y_pred):
+        raise NotImplementedError
+
+    def get_config(self):
+        config = super(_PianoRollLoss, self).get_config()
+        config.update({
+            'from_logits': self.from_logits,
+            'compute_dtype': self.compute_dtype.name if self.compute_dtype is not None else None
+        })
+        return config
+
+
+class WeightedBinaryCrossentropy(_PianoRollLoss):
+    """
+    Binary cross-entropy giving more weight to the positive class (where the notes are being played)
+    With from_logits=True the stable fused TF primitive is used
+    """
+
+    def __init__(self, pos_weight, from_logits=False, compute_dtype=None,
+                 name='weighted_binary_crossentropy', **kwargs):
+        self.pos_weight = float(pos_weight)
+        self._pos_weight = tf.constant(self.pos_weight, dtype=tf.float32)
+        super(WeightedBinaryCrossentropy, self).__init__(from_logits=from_logits, compute_dtype=compute_dtype,
+                                                         name=name, **kwargs)
+
+    def _elementwise_loss(self, y_true, y_pred):
+        pos_weight = tf.cast(self._pos_weight, y_pred.dtype)
+
+        if self.from_logits:
+            return tf.nn.weighted_cross_entropy_with_logits(labels=y_true, logits=y_pred, pos_weight=pos_weight)
+
+        # The clip still guards positive labels against a saturated p == 0; under XLA it fuses
+        # into the same kernel, so it costs no extra pass over the tensor
+        y_pred = tf.clip_by_value(y_pred, *_clip_bounds(y_pred.dtype))
+        loss_pos = -pos_weight * tf.math.xlogy(y_true, y_pred)
+        loss_neg = -tf.math.xlog1py(1 - y_true, -y_pred)
+
+        return loss_pos + loss_neg
+
+    def get_config(self):
+        config = super(WeightedBinaryCrossentropy, self).get_config()
+        config['pos_weight'] = self.pos_weight
+        return config
+
+
+def weighted_binary_crossentropy(pos_weight, from_logits=False, compute_dtype=None):
     """
     Function for giving more weight to the positive class (where the notes are being played)
     """
-    def loss(y_true, y_pred):
-        y_pred = tf.clip_by_value(y_pred, 1e-7, 1.0 - 1e-7)
-        loss_pos = -pos_weight * y_true * tf.math.log(y_pred)
-        loss_neg = -(1 - y_true) * tf.math.log(1 - y_pred)
+    return WeightedBinaryCrossentropy(pos_weight, from_logits=from_logits, compute_dtype=compute_dtype)
 
-        loss = loss_pos + loss_neg
 
-        return tf.reduce_mean(loss)
+def _focal_modulation(one_minus_pt, gamma):
+    """
+    (1 - p_t) ** gamma, as a multiply chain for the common gammas; gamma is a Python float,
+    so the branch is picked once at trace time
+    """
+    if gamma == 1.0:
+        return one_minus_pt
+    if gamma == 2.0:
+        return tf.square(one_minus_pt)
+    if gamma == 2.5:
+        return tf.square(one_minus_pt) * tf.sqrt(one_minus_pt)
+    if gamma == 3.0:
+        return tf.square(one_minus_pt) * one_minus_pt
+    return tf.pow(one_minus_pt, tf.constant(gamma, dtype=one_minus_pt.dtype))
+
+
+class FocalLoss(_PianoRollLoss):
+    """
+    With from_logits=True the loss is computed in the logit domain:
+    log(p) = -softplus(-z), log(1 - p) = -softplus(z), no clipping needed
+    """
 
-    return loss
+    def __init__(self, gamma=2.0, alpha=0.25, from_logits=False, compute_dtype=None,
+                 name='focal_loss', **kwargs):
+        self.gamma = float(gamma)
+        self.alpha = float(alpha)
+        self._alpha = tf.constant(self.alpha, dtype=tf.float32)
+        super(FocalLoss, self).__init__(from_logits=from_logits, compute_dtype=compute_dtype, name=name, **kwargs)
 
+    def _elementwise_loss(self, y_true, y_pred):
+        alpha = tf.cast(self._alpha, y_pred.dtype)
+        # Piano-roll labels are 0/1, so the per-class terms are plain selects on one mask
+        positive = y_true > 0.5
 
-def focal_loss(gamma=2.0, alpha=0.25):
-    def loss_fn(y_true, y_pred):
-        y_pred = tf.clip_by_value(y_pred, 1e-7, 1 - 1e-7)
+        if self.from_logits:
+            bce = y_true * tf.nn.softplus(-y_pred) + (1 - y_true) * tf.nn.softplus(y_pred)
+            p_t = tf.sigmoid(tf.where(positive, y_pred, -y_pred))
+        else:
+            y_pred = tf.clip_by_value(y_pred, *_clip_bounds(y_pred.dtype))
+            bce = -tf.math.xlogy(y_true, y_pred) - tf.math.xlog1py(1 - y_true, -y_pred)
+            p_t = tf.where(positive, y_pred, 1 - y_pred)
 
-        bce = -y_true * tf.math.log(y_pred) - (1 - y_true) * tf.math.log(1 - y_pred)
+        alpha_factor = tf.where(positive, alpha, 1 - alpha)
+        modulating_factor = _focal_modulation(1.0 - p_t, self.gamma)
 
-        p_t = (y_true * y_pred) + ((1 - y_true) * (1 - y_pred))
-        alpha_factor = y_true * alpha + (1 - y_true) * (1 - alpha)
-        modulating_factor = tf.pow(1.0 - p_t, gamma)
+        return alpha_factor * modulating_factor * bce
 
-        loss = alpha_factor * modulating_factor * bce
+    def get_config(self):
+        config = super(FocalLoss, self).get_config()
+        config.update({
+            'gamma': self.gamma,
+            'alpha': self.alpha
+        })
+        return config
 
-        return tf.reduce_mean(loss)
 
-    return loss_fn
+def focal_loss(gamma=2.0, alpha=0.25, from_logits=False, compute_dtype=None):
+    return FocalLoss(gamma=gamma, alpha=alpha, from_logits=from_logits, compute_dtype=compute_dtype)
 
 
 class F1Score(tf.keras.metrics.Metric):
     def __init__(self, name='f1_score', threshold=0.3, **kwargs):
         super(F1Score, self).__init__(name=name, **kwargs)
         self.threshold = threshold
-        self.precision = tf.keras.metrics.Precision(thresholds=threshold)
-        self.recall = tf.keras.metrics.Recall(thresholds=threshold)
+        # Same counts Precision and Recall keep, gathered in one pass instead of two; int64 keeps
+        # unweighted counts exact (float32 stops changing after 2^24), weighted sums go to float64 ones
+        self.tp = self.add_weight(name='tp', initializer='zeros', dtype=tf.int64)
+        self.fp = self.add_weight(name='fp', initializer='zeros', dtype=tf.int64)
+        self.fn = self.add_weight(name='fn', initializer='zeros', dtype=tf.int64)
+        self.weighted_tp = self.add_weight(name='weighted_tp', initializer='zeros', dtype=tf.float64)
+        self.weighted_fp = self.add_weight(name='weighted_fp', initializer='zeros', dtype=tf.float64)
+        self.weighted_fn = self.add_weight(name='weighted_fn', initializer='zeros', dtype=tf.float64)
+
+        # Trace the unweighted update now so the first training step doesn't stall on it
+        self._count.get_concrete_function()
 
     def update_state(self, y_true, y_pred, sample_weight=None):
-        self.precision.update_state(y_true, y_pred, sample_weight)
-        self.recall.update_state(y_true, y_pred, sample_weight)
+        y_true = tf.cast(y_true, tf.float32)
+        y_pred = tf.cast(y_pred, tf.float32)
+
+        if sample_weight is None:
+            self._count(y_true, y_pred)
+            return
+
+        # Per-example or per-frame weights apply to every pitch under them
+        weight = tf.cast(sample_weight, tf.float64)
+        rank = weight.shape.rank
+        if rank is None or rank > 3:
+            raise ValueError(f"sample_weight must have a static rank of at most 3 "
+                             f"([batch, frames, pitches]), got shape {weight.shape}")
+        weight = tf.reshape(weight, tf.concat([tf.shape(weight), tf.ones([3 - rank], tf.int32)], axis=0))
+        self._count_weighted(y_true, y_pred, tf.broadcast_to(weight, tf.shape(y_pred)))
+
+    def _code(self, y_true, y_pred):
+        """
+        2-bit (pred, true) code per element, flattened: 3 = true positive, 2 = false positive,
+        1 = false negative, 0 = true negative; thresholded like Precision/Recall (strictly above)
+        """
+        pred = tf.cast(y_pred > self.threshold, tf.int32)
+        true = tf.cast(tf.cast(y_true, tf.bool), tf.int32)
+        return tf.reshape(pred * 2 + true, [-1])
+
+    # One XLA dispatch for the thresholding and all three counts, traced once for piano-roll batches
+    @tf.function(input_signature=PIANO_ROLL_SIGNATURE, jit_compile=True)
+    def _count(self, y_true, y_pred):
+        # A compare-and-sum per code rather than bincount, whose output size XLA can't treat as static;
+        # the three reductions share one fused sweep over the codes
+        code = self._code(y_true, y_pred)
+        self.tp.assign_add(tf.reduce_sum(tf.cast(tf.equal(code, 3), tf.int64)))
+        self.fp.assign_add(tf.reduce_sum(tf.cast(tf.equal(code, 2), tf.int64)))
+        self.fn.assign_add(tf.reduce_sum(tf.cast(tf.equal(code, 1), tf.int64)))
+
+    @tf.function(input_signature=PIANO_ROLL_SIGNATURE + [tf.TensorSpec([None, None, 88], tf.float64)],
+                 jit_compile=True)
+    def _count_weighted(self, y_true, y_pred, weight):
+        code = self._code(y_true, y_pred)
+        weight = tf.reshape(weight, [-1])
+        self.weighted_tp.assign_add(tf.reduce_sum(weight * tf.cast(tf.equal(code, 3), tf.float64)))
+        self.weighted_fp.assign_add(tf.reduce_sum(weight * tf.cast(tf.equal(code, 2), tf.float64)))
+        self.weighted_fn.assign_add(tf.reduce_sum(weight * tf.cast(tf.equal(code, 1), tf.float64)))
 
     def result(self):
-        p = self.precision.result()
-        r = self.recall.result()
-        return tf.math.divide_no_nan(2 * p * r, p + r)
-
-    def reset_states(self):
-        self.precision.reset_states()
-        self.recall.reset_states()
\ No newline at end of file
+        tp = tf.cast(tf.cast(self.tp, tf.float64) + self.weighted_tp, tf.float32)
+        fp = tf.cast(tf.cast(self.fp, tf.float64) + self.weighted_fp, tf.float32)
+        fn = tf.cast(tf.cast(self.fn, tf.float64) + self.weighted_fn, tf.float32)
+        return tf.math.divide_no_nan(2 * tp, 2 * tp + fp + fn)
+
+    def reset_state(self):
+        for count in (self.tp, self.fp, self.fn):
+            count.assign(0)
+        for count in (self.weighted_tp, self.weighted_fp, self.weighted_fn):
+            count.assign(0.0)